@@ -155,13 +155,15 @@ class Hopfield(Module):
         :param args: tensors to eventually transpose (dependent on the state of "batch_first")
         :return: eventually transposed tensors
         """
-        transposed_result = tuple(_.transpose(0, 1) for _ in args) if self.__batch_first else args
+        transposed_result = tuple(
+            None if _ is None else _.transpose(0, 1) for _ in args) if self.__batch_first else args
         return transposed_result[0] if len(transposed_result) == 1 else transposed_result
 
     def _associate(self, data: Union[Tensor, Tuple[Tensor, Tensor, Tensor]],
                    return_raw_associations: bool = False, return_projected_patterns: bool = False,
                    stored_pattern_padding_mask: Optional[Tensor] = None,
-                   association_mask: Optional[Tensor] = None) -> Tuple[Optional[Tensor], ...]:
+                   association_mask: Optional[Tensor] = None,
+                   static_patterns: Optional[Tuple[Tensor, Tensor]] = None) -> Tuple[Optional[Tensor], ...]:
         """
         Apply Hopfield association module on specified data.
 
@@ -170,6 +172,7 @@ class Hopfield(Module):
         :param return_projected_patterns: return pattern projection values, unmodified
         :param stored_pattern_padding_mask: mask to be applied on stored patterns
         :param association_mask: mask to be applied on inner association matrix
+        :param static_patterns: projected stored patterns and pattern projections (see "project_stored_patterns")
         :return: Hopfield-processed input data
         """
         assert (type(data) == Tensor) or ((type(data) == tuple) and (len(data) == 3)), \
@@ -185,7 +188,7 @@ class Hopfield(Module):
             stored_pattern, state_pattern, pattern_projection)
 
         # Optionally apply stored pattern normalization.
-        if self.norm_stored_pattern is not None:
+        if (self.norm_stored_pattern is not None) and (stored_pattern is not None):
             stored_pattern = self.norm_stored_pattern(input=stored_pattern.reshape(
                 shape=(-1, stored_pattern.shape[2]))).reshape(shape=stored_pattern.shape)
 
@@ -195,36 +198,61 @@ class Hopfield(Module):
                 shape=(-1, state_pattern.shape[2]))).reshape(shape=state_pattern.shape)
 
         # Optionally apply pattern projection normalization.
-        if self.norm_pattern_projection is not None:
+        if (self.norm_pattern_projection is not None) and (pattern_projection is not None):
             pattern_projection = self.norm_pattern_projection(input=pattern_projection.reshape(
                 shape=(-1, pattern_projection.shape[2]))).reshape(shape=pattern_projection.shape)
 
         # Apply Hopfield association and optional activation function.
+        static_k, static_v = (None, None) if static_patterns is None else static_patterns
         return self.association_core(
             query=state_pattern, key=stored_pattern, value=pattern_projection,
             key_padding_mask=stored_pattern_padding_mask, need_weights=False, attn_mask=association_mask,
             scaling=self.__scaling, update_steps_max=self.__update_steps_max, update_steps_eps=self.__update_steps_eps,
-            return_raw_associations=return_raw_associations, return_pattern_projections=return_projected_patterns)
+            return_raw_associations=return_raw_associations, return_pattern_projections=return_projected_patterns,
+            static_k=static_k, static_v=static_v)
 
     def forward(self, input: Union[Tensor, Tuple[Tensor, Tensor, Tensor]],
                 stored_pattern_padding_mask: Optional[Tensor] = None,
-                association_mask: Optional[Tensor] = None) -> Tensor:
+                association_mask: Optional[Tensor] = None,
+                static_patterns: Optional[Tuple[Tensor, Tensor]] = None) -> Tensor:
         """
         Apply Hopfield association on specified data.
 
         :param input: data to be processed by Hopfield association module
         :param stored_pattern_padding_mask: mask to be applied on stored patterns
         :param association_mask: mask to be applied on inner association matrix
+        :param static_patterns: projected stored patterns and pattern projections (see "project_stored_patterns"),
+            stored pattern and pattern projection in "input" may be None if specified
         :return: Hopfield-processed input data
         """
         association_output = self._maybe_transpose(self._associate(
             data=input, return_raw_associations=False,
             stored_pattern_padding_mask=stored_pattern_padding_mask,
-            association_mask=association_mask)[0])
+            association_mask=association_mask, static_patterns=static_patterns)[0])
         if self.association_activation is not None:
             association_output = self.association_activation(association_output)
         return association_output
 
+    def project_stored_patterns(self, input: Tuple[Tensor, Tensor]) -> Tuple[Tensor, Tensor]:
+        """
+        Normalize and project stored patterns and pattern projections into the Hopfield space. The result can be
+        passed as "static_patterns" to "forward" to reuse the projections of fixed patterns across calls.
+
+        :param input: stored patterns and pattern projections
+        :return: projected stored patterns and pattern projections
+        """
+        stored_pattern, pattern_projection = self._maybe_transpose(*input)
+
+        if self.norm_stored_pattern is not None:
+            stored_pattern = self.norm_stored_pattern(input=stored_pattern.reshape(
+                shape=(-1, stored_pattern.shape[2]))).reshape(shape=stored_pattern.shape)
+
+        if self.norm_pattern_projection is not None:
+            pattern_projection = self.norm_pattern_projection(input=pattern_projection.reshape(
+                shape=(-1, pattern_projection.shape[2]))).reshape(shape=pattern_projection.shape)
+
+        return self.association_core.project_key_value(key=stored_pattern, value=pattern_projection)
+
     def get_association_matrix(self, input: Union[Tensor, Tuple[Tensor, Tensor, Tensor]],
                                stored_pattern_padding_mask: Optional[Tensor] = None,
                                association_mask: Optional[Tensor] = None) -> Tensor:
@@ -3,7 +3,7 @@ import torch.nn as nn
 
 from torch import Tensor
 from torch.nn import Linear, Module, Parameter
-from typing import Optional
+from typing import Optional, Tuple
 
 from .functional import hopfield_core_forward
 
@@ -284,6 +284,8 @@ class HopfieldCore(Module):
         update_steps_eps=1e-4,  # type: float
         return_raw_associations=False,  # type: bool
         return_pattern_projections=False,  # type: bool
+        static_k=None,  # type: Optional[Tensor]
+        static_v=None,  # type: Optional[Tensor]
     ):
         # type: (...) -> Tuple[Tensor, Optional[Tensor], Optional[Tensor]]
         r"""
@@ -305,6 +307,8 @@ class HopfieldCore(Module):
             update_steps_eps: minimum difference threshold between two consecutive association update steps.
             return_raw_associations: return raw association (softmax) values, unmodified.
             return_pattern_projections: return pattern projection values, unmodified.
+            static_k, static_v: already projected key and value, e.g. from "project_key_value". If both are
+                specified, key and value may be None.
 
         Shape:
             - Inputs:
@@ -336,7 +340,10 @@ class HopfieldCore(Module):
             - attn_raw: :math:``(N, num_heads, L, S)`, where N is the batch size,
               L is the target sequence length, S is the source sequence length.
         """
-        if self.query_as_static and self.key_as_static:
+        if key is None:
+            head_dim = self.head_dim
+            embed_dim_to_check = query.shape[2] if self.query_as_static else self.embed_dim
+        elif self.query_as_static and self.key_as_static:
             assert (
                 query.shape[2] == key.shape[2]
             ), f"query shape[2] of {query.shape[2]} and key shape[2] of {key.shape[2]} need to be equal"
@@ -360,16 +367,17 @@ class HopfieldCore(Module):
                 self.head_dim if self.query_as_static else self.embed_dim,
             )
 
-        assert self.value_as_static or (
-            value.shape[2] == self.vdim
-        ), f"value shape[2] of {value.shape[2]} invalid, needs to be {self.vdim}."
-        assert any(
-            (
-                not self.value_as_static,
-                self.value_as_static and value.shape[2] == self.pattern_dim,
-                self.disable_out_projection,
-            )
-        ), f"value shape[2] of {value.shape[2]} invalid, needs to be {self.pattern_dim}"
+        if value is not None:
+            assert self.value_as_static or (
+                value.shape[2] == self.vdim
+            ), f"value shape[2] of {value.shape[2]} invalid, needs to be {self.vdim}."
+            assert any(
+                (
+                    not self.value_as_static,
+                    self.value_as_static and value.shape[2] == self.pattern_dim,
+                    self.disable_out_projection,
+                )
+            ), f"value shape[2] of {value.shape[2]} invalid, needs to be {self.pattern_dim}"
 
         out_weights, out_bias = None, None
         if not self.disable_out_projection:
@@ -412,6 +420,8 @@ class HopfieldCore(Module):
                 update_steps_eps=update_steps_eps,
                 return_raw_associations=return_raw_associations,
                 return_projected_patterns=return_pattern_projections,
+                static_k=static_k,
+                static_v=static_v,
             )
         else:
             return hopfield_core_forward(
@@ -446,4 +456,61 @@ class HopfieldCore(Module):
                 update_steps_eps=update_steps_eps,
                 return_raw_associations=return_raw_associations,
                 return_projected_patterns=return_pattern_projections,
+                static_k=static_k,
+                static_v=static_v,
+            )
+
+    def project_key_value(
+        self,
+        key,  # type: Tensor
+        value,  # type: Tensor
+    ):
+        # type: (...) -> Tuple[Tensor, Tensor]
+        r"""
+        Project key (stored pattern) and value (pattern projection) into the Hopfield space, in the layout
+        expected by "static_k" and "static_v" of forward. Allows the projections of fixed patterns to be
+        computed once and reused across calls.
+
+        Shape:
+            - Inputs:
+            - key: :math:`(S, N, E)`, where S is the source sequence length, N is the batch size, E is
+              the embedding dimension.
+            - value: :math:`(S, N, E)` where S is the source sequence length, N is the batch size, E is
+              the embedding dimension.
+
+            - Outputs:
+            - static_k: :math:`(N*num_heads, S, head_dim)`
+            - static_v: :math:`(N*num_heads, S, pattern_dim)`
+        """
+        assert not any(
+            (
+                self.static_execution,
+                self.key_as_static,
+                self.value_as_static,
+                self.value_as_connected,
+                self.normalize_pattern,
+                self.bias_k is not None,
+                self.bias_v is not None,
+                self.add_zero_attn,
             )
+        ), r"projection of key and value only supported for plain (non-static) projections."
+
+        # Projections are stored as [query, key, value] (without query if static).
+        _start = 0 if self.query_as_static else self.virtual_hopfield_dim
+        _end = _start + self.virtual_hopfield_dim
+        if self._qkv_same_embed_dim:
+            k_weight = self.in_proj_weight[_start:_end, :]
+            v_weight = self.in_proj_weight[_end:, :]
+        else:
+            k_weight, v_weight = self.k_proj_weight, self.v_proj_weight
+        k_bias, v_bias = None, None
+        if self.in_proj_bias is not None:
+            k_bias = self.in_proj_bias[_start:_end]
+            v_bias = self.in_proj_bias[_end:]
+
+        bsz = key.shape[1]
+        k = nn.functional.linear(key, k_weight, k_bias)
+        k = k.contiguous().view(-1, bsz * self.num_heads, self.head_dim).transpose(0, 1)
+        v = nn.functional.linear(value, v_weight, v_bias)
+        v = v.contiguous().view(v.shape[0], bsz * self.num_heads, -1).transpose(0, 1)
+        return k, v
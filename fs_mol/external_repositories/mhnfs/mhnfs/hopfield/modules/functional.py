@@ -69,7 +69,8 @@ def hopfield_core_forward(query,                           # type: Tensor
             and value in different forms. If false, in_proj_weight will be used, which is
             a combination of q_proj_weight, k_proj_weight, v_proj_weight.
         q_proj_weight, k_proj_weight, v_proj_weight, in_proj_bias: input projection weight and bias.
-        static_k, static_v: static key and value used for attention operators.
+        static_k, static_v: static key and value used for attention operators. If both are specified, key and value
+            may be None, in which case their projection is skipped.
 
         key_as_static: interpret specified key as being static.
         query_as_static: interpret specified key as being static.
@@ -135,10 +136,12 @@ def hopfield_core_forward(query,                           # type: Tensor
                 normalize_pattern=normalize_pattern, p_norm_weight=p_norm_weight, p_norm_bias=p_norm_bias,
                 head_dim=head_dim, pattern_dim=pattern_dim, scaling=scaling, update_steps_max=update_steps_max,
                 update_steps_eps=update_steps_eps, return_raw_associations=return_raw_associations)
-    tgt_len, bsz, embed_dim = query.shape[0], value.shape[1], query.shape[2]
+    tgt_len, bsz, embed_dim = query.shape[0], query.shape[1], query.shape[2]
     assert embed_dim == embed_dim_to_check
+    assert (key is not None and value is not None) or (static_k is not None and static_v is not None), \
+        r'key and value may only be omitted if "static_k" and "static_v" are specified.'
     # allow MHA to have different sizes for the feature dimension
-    assert key.size(0) == value.size(0) and key.size(1) == value.size(1)
+    assert (key is None) or (key.size(0) == value.size(0) and key.size(1) == value.size(1))
 
     assert (scaling is None) or (type(scaling) in (float, torch.Tensor))
     if type(scaling) == torch.Tensor:
@@ -186,7 +189,16 @@ def hopfield_core_forward(query,                           # type: Tensor
         # The query is already projected into the "Hopfield" space at "update_step" equals 0.
         # No more projection necessary if "update_step" greater than 0.
         if update_step == 0:
-            if not use_separate_proj_weight:
+            if (key is None) and (value is None):
+                # key and value are already projected ("static_k" and "static_v")
+                if query_as_static:
+                    q = query.repeat(1, num_heads, 1)
+                else:
+                    _w = in_proj_weight[:hopfield_dim, :] if q_proj_weight is None else q_proj_weight
+                    _b = None if in_proj_bias is None else in_proj_bias[:hopfield_dim]
+                    q = nn.functional.linear(query, _w, _b)
+
+            elif not use_separate_proj_weight:
 
                 if torch.equal(query, key) and torch.equal(key, value) and not (
                         key_as_static or query_as_static or value_as_static):
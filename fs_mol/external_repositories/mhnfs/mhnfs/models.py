@@ -90,8 +90,9 @@ class MHNfs(pl.LightningModule):
         # Cross-attention module
         self.crossAttentionModule = CrossAttentionModule(self.cfg)
 
-        # Similarity module
-        self.similarity_function = SimilarityModule
+        # Similarity module (scripted, so that the masking, reduction and scaling ops
+        # can be fused)
+        self.similarity_function = torch.jit.script(SimilarityModule(cfg))
 
         # Output function
         self.sigmoid = torch.nn.Sigmoid()
@@ -161,14 +162,13 @@ class MHNfs(pl.LightningModule):
 
         # Build predictions from a weighted sum over support set labels
         # - Layernorm:
-        if self.cfg.model.layerNormBlock.usage:
-            (
-                query_embedding,
-                support_actives_embedding,
-                support_inactives_embedding,
-            ) = self.layerNormBlock(
-                query_embedding, support_actives_embedding, support_inactives_embedding
-            )
+        (
+            query_embedding,
+            support_actives_embedding,
+            support_inactives_embedding,
+        ) = self.layerNormBlock(
+            query_embedding, support_actives_embedding, support_inactives_embedding
+        )
 
         # - Similarity module:
         predictions_support_actives = self.similarity_function(
@@ -176,7 +176,6 @@ class MHNfs(pl.LightningModule):
             support_actives_embedding,
             support_molecules_active_mask,
             support_set_actives_size,
-            self.cfg,
         )
 
         predictions_support_inactives = self.similarity_function(
@@ -184,7 +183,6 @@ class MHNfs(pl.LightningModule):
             support_inactives_embedding,
             support_molecules_inactive_mask,
             support_set_inactives_size,
-            self.cfg,
         )
 
         predictions = predictions_support_actives - predictions_support_inactives
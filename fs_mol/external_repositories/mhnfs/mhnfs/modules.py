@@ -1,8 +1,12 @@
 import torch
 import torch.nn as nn
+from torch.nn.functional import normalize
 from omegaconf import OmegaConf
+from collections import OrderedDict
 from functools import partial
+from contextlib import nullcontext
 import os
+import re
 import inspect
 
 # add parentdir
@@ -13,94 +17,157 @@ os.sys.path.insert(0, parentdir)
 from mhnfs.hopfield.modules import Hopfield
 from mhnfs.initialization import init_weights
 
+try:
+    from torch.nn.attention import SDPBackend, sdpa_kernel
+
+    # Prefer the fused attention kernels, the math backend is only a fallback for
+    # inputs the fused kernels do not support
+    fused_attention = partial(
+        sdpa_kernel,
+        [
+            SDPBackend.FLASH_ATTENTION,
+            SDPBackend.EFFICIENT_ATTENTION,
+            SDPBackend.MATH,
+        ],
+    )
+except ImportError:
+    # torch < 2.3: the attention backend is selected automatically
+    fused_attention = nullcontext
+
 
 # Mappings
+# ReLU follows a linear layer everywhere, so it can safely overwrite its input
 activation_function_mapping = {
-    "relu": nn.ReLU(),
-    "selu": nn.SELU(),
-    "sigmoid": nn.Sigmoid(),
+    "relu": partial(nn.ReLU, inplace=True),
+    "selu": nn.SELU,
+    "sigmoid": nn.Sigmoid,
 }
 
 dropout_mapping = {"relu": nn.Dropout, "selu": nn.AlphaDropout}
 
+# Scaling of the similarity sums: 0: none, 1: 1/N, 2: 1/sqrt(N)
+similarity_scaling_mapping = {"1/N": 1, "1/sqrt(N)": 2}
+
 
 # Modules
+class _EncoderLayer(nn.Module):
+    """
+    Fully connected layer of the molecule encoder: dropout -> linear -> activation.
+    """
+
+    def __init__(
+        self, activation: str, dropout: float, in_features: int, out_features: int
+    ):
+        super(_EncoderLayer, self).__init__()
+
+        self.dropout = dropout_mapping[activation](dropout)
+        self.linear = nn.Linear(in_features, out_features)
+        self.activation = activation_function_mapping[activation]()
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.activation(self.linear(self.dropout(x)))
+
+
 class EncoderBlock(nn.Module):
     """
     Fully connected molecule encoder block.
     - Takes molecular descriptors, e.g., ECFPs and RDKit fps as inputs
     - returns a molecular representation
+
+    All layers are packed into one nn.Sequential of _EncoderLayer blocks, which can
+    optionally be compiled with TorchScript (cfg.model.encoder.jit).
     """
 
     def __init__(self, cfg: OmegaConf):
         super(EncoderBlock, self).__init__()
 
-        # Input layer
-        self.dropout = dropout_mapping[cfg.model.encoder.activation](
-            cfg.model.encoder.regularization.input_dropout
-        )
-        self.fc = nn.Linear(
-            cfg.model.encoder.input_dim, cfg.model.encoder.number_hidden_neurons
-        )
-        self.act = activation_function_mapping[cfg.model.encoder.activation]
-
-        # Hidden layer
-        self.hidden_linear_layers = nn.ModuleList([])
-        self.hidden_dropout_layers = nn.ModuleList([])
-        self.hidden_activations = nn.ModuleList([])
-
-        for _ in range(cfg.model.encoder.number_hidden_layers):
-            self.hidden_dropout_layers.append(
-                dropout_mapping[cfg.model.encoder.activation](
-                    cfg.model.encoder.regularization.dropout
-                )
-            )
-            self.hidden_linear_layers.append(
-                nn.Linear(
-                    cfg.model.encoder.number_hidden_neurons,
-                    cfg.model.encoder.number_hidden_neurons,
-                )
+        activation = cfg.model.encoder.activation
+        hidden_dim = cfg.model.encoder.number_hidden_neurons
+        layer = partial(_EncoderLayer, activation)
+
+        self.net = nn.Sequential(
+            OrderedDict(
+                [
+                    # Input layer
+                    (
+                        "input",
+                        layer(
+                            cfg.model.encoder.regularization.input_dropout,
+                            cfg.model.encoder.input_dim,
+                            hidden_dim,
+                        ),
+                    ),
+                    # Hidden layer
+                    (
+                        "hidden",
+                        nn.Sequential(
+                            *[
+                                layer(
+                                    cfg.model.encoder.regularization.dropout,
+                                    hidden_dim,
+                                    hidden_dim,
+                                )
+                                for _ in range(cfg.model.encoder.number_hidden_layers)
+                            ]
+                        ),
+                    ),
+                    # Output layer
+                    (
+                        "output",
+                        layer(
+                            cfg.model.encoder.regularization.dropout,
+                            hidden_dim,
+                            cfg.model.associationSpace_dim,
+                        ),
+                    ),
+                ]
             )
-            self.hidden_activations.append(
-                activation_function_mapping[cfg.model.encoder.activation]
-            )
-
-        # Output layer
-        self.dropout_o = dropout_mapping[cfg.model.encoder.activation](
-            cfg.model.encoder.regularization.dropout
-        )
-        self.fc_o = nn.Linear(
-            cfg.model.encoder.number_hidden_neurons,
-            cfg.model.associationSpace_dim,
         )
-        self.act_o = activation_function_mapping[cfg.model.encoder.activation]
 
         # Initialization
-        encoder_initialization = partial(init_weights, cfg.model.encoder.activation)
+        encoder_initialization = partial(init_weights, activation)
         self.apply(encoder_initialization)
 
+        if cfg.model.encoder.get("jit", False):
+            self.net = torch.jit.script(self.net)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # Checkpoints of the original MHNfs implementation store the linear layers as
+        # fc, hidden_linear_layers.<i> and fc_o
+        legacy_names = [
+            (re.compile(r"^fc\."), "net.input.linear."),
+            (re.compile(r"^hidden_linear_layers\.(\d+)\."), r"net.hidden.\1.linear."),
+            (re.compile(r"^fc_o\."), "net.output.linear."),
+        ]
+        for key in [k for k in state_dict.keys() if k.startswith(prefix)]:
+            name = key[len(prefix) :]
+            for pattern, replacement in legacy_names:
+                if pattern.match(name):
+                    state_dict[prefix + pattern.sub(replacement, name)] = (
+                        state_dict.pop(key)
+                    )
+                    break
+
+        super(EncoderBlock, self)._load_from_state_dict(
+            state_dict, prefix, *args, **kwargs
+        )
+
     def forward(self, molecule_representation: torch.Tensor) -> torch.Tensor:
-        # Input layer
-        x = self.dropout(molecule_representation)
-        x = self.fc(x)
-        x = self.act(x)
-
-        # Hidden layer
-        for hidden_dropout, hidden_layer, hidden_activation_function in zip(
-            self.hidden_dropout_layers,
-            self.hidden_linear_layers,
-            self.hidden_activations,
-        ):
-            x = hidden_dropout(x)
-            x = hidden_layer(x)
-            x = hidden_activation_function(x)
+        return self.net(molecule_representation)
 
-        # Output layer
-        x = self.dropout_o(x)
-        x = self.fc_o(x)
-        x = self.act_o(x)
+    def _fuse_for_inference(self):
+        """
+        Removes the dropout layers, which are no-ops at inference. Call after the
+        weights are loaded and the model is in eval mode; the encoder cannot be trained
+        afterwards. A scripted encoder is frozen instead, which removes the dropouts and
+        inlines the weights as constants.
+        """
+        if isinstance(self.net, torch.jit.ScriptModule):
+            self.net = torch.jit.freeze(self.net.eval())
+            return
 
-        return x
+        for layer in [self.net.input, *self.net.hidden, self.net.output]:
+            layer.dropout = nn.Identity()
 
 
 class ContextModule(nn.Module):
@@ -136,6 +203,40 @@ class ContextModule(nn.Module):
         hopfield_initialization = partial(init_weights, "linear")
         self.hopfield.apply(hopfield_initialization)
 
+        # Optionally run the retrieval in bfloat16 at inference
+        self.bf16_inference = cfg.model.hopfield.get("bf16_inference", False)
+
+        # Projected context set for inference (see precompute_context)
+        self.register_buffer("_context_keys", None, persistent=False)
+        self.register_buffer("_context_values", None, persistent=False)
+        self._precomputed_context = None
+
+        # Optionally compile the retrieval. The padded support sets and the context set
+        # have static shapes, so the compiled graph can be replayed as a CUDA graph.
+        if cfg.model.context.get("compile", False):
+            self.compile(mode="reduce-overhead", dynamic=False)
+
+    @torch.no_grad()
+    def precompute_context(self, context_set_embedding: torch.Tensor):
+        """
+        Caches the normalized and projected context set (stored patterns and pattern
+        projections of the Hopfield retrieval). At inference, forward reuses the cache
+        as long as it receives this context set tensor, which skips the projection of
+        the context set for every batch. Has to be called again after the weights or the
+        context set changed.
+        """
+        (
+            self._context_keys,
+            self._context_values,
+        ) = self.hopfield.project_stored_patterns(
+            (context_set_embedding, context_set_embedding)
+        )
+        if self.bf16_inference:
+            # Avoid re-casting the cached projections under autocast on every call
+            self._context_keys = self._context_keys.to(torch.bfloat16)
+            self._context_values = self._context_values.to(torch.bfloat16)
+        self._precomputed_context = context_set_embedding
+
     def forward(
         self,
         query_embedding: torch.Tensor,
@@ -164,19 +265,38 @@ class ContextModule(nn.Module):
         support set molecules:
         (query, active support set molecules, inactive support set molecules)
         """
+
         # Stack embeddings together to perform a "batch-retrieval"
+        # (torch.cat returns a contiguous tensor, so flattening is a zero-copy view)
         s = torch.cat(
             (query_embedding, support_actives_embedding, support_inactives_embedding),
             dim=1,
         )
-        s_flattend = s.reshape(1, s.shape[0] * s.shape[1], s.shape[2])
+        s_flattend = s.view(1, s.shape[0] * s.shape[1], s.shape[2])
 
         # Retrieval
-        s_h = self.hopfield((context_set_embedding, s_flattend, context_set_embedding))
+        # (autocast is only entered if enabled, a disabled autocast would switch off an
+        # enclosing one, e.g. AMP training)
+        if self.bf16_inference and not self.training:
+            retrieval_precision = torch.autocast(
+                device_type=s_flattend.device.type, dtype=torch.bfloat16
+            )
+        else:
+            retrieval_precision = nullcontext()
+        with retrieval_precision:
+            if not self.training and context_set_embedding is self._precomputed_context:
+                s_h = self.hopfield(
+                    (None, s_flattend, None),
+                    static_patterns=(self._context_keys, self._context_values),
+                )
+            else:
+                s_h = self.hopfield(
+                    (context_set_embedding, s_flattend, context_set_embedding)
+                )
 
         # Combine retrieval with skip connection
         s_updated = s_flattend + s_h
-        s_updated_inputShape = s_updated.reshape(
+        s_updated_inputShape = s_updated.view(
             s.shape[0], s.shape[1], s.shape[2]
         )  # reshape tensor back to input shape
 
@@ -207,6 +327,8 @@ class LayerNormalizingBlock(nn.Module):
 
         self.cfg = cfg
 
+        # Since the layernorm operations are optional, the module falls back to identity
+        # mappings if the referring option is not set in the config.
         if cfg.model.layerNormBlock.usage:
             self.layernorm_query = nn.LayerNorm(
                 cfg.model.associationSpace_dim,
@@ -220,6 +342,16 @@ class LayerNormalizingBlock(nn.Module):
                 cfg.model.associationSpace_dim,
                 elementwise_affine=cfg.model.layerNormBlock.affine,
             )
+        else:
+            self.layernorm_query = nn.Identity()
+            self.layernorm_support_actives = nn.Identity()
+            self.layernorm_support_inactives = nn.Identity()
+
+        # Without affine parameters the three layernorms compute the same function, so
+        # query and support set molecules can be normalized in a single call
+        self.stacked_normalization = (
+            cfg.model.layerNormBlock.usage and not cfg.model.layerNormBlock.affine
+        )
 
     def forward(
         self,
@@ -246,17 +378,32 @@ class LayerNormalizingBlock(nn.Module):
         """
 
         # Layer normalization
-        # Since the layernorm operations are optional the module just updates represen-
-        # tations if the the referring option is set in the config.
-        if self.cfg.model.layerNormBlock.usage:
-            query_embedding = self.layernorm_query(query_embedding)
-            support_actives_embedding = self.layernorm_support_actives(
-                support_actives_embedding
-            )
-            if support_inactives_embedding is not None:
-                support_inactives_embedding = self.layernorm_support_inactives(
-                    support_inactives_embedding
+        if self.stacked_normalization and support_inactives_embedding is not None:
+            padding_size_actives = support_actives_embedding.shape[1]
+            s = self.layernorm_query(
+                torch.cat(
+                    (
+                        query_embedding,
+                        support_actives_embedding,
+                        support_inactives_embedding,
+                    ),
+                    dim=1,
                 )
+            )
+            return (
+                s[:, :1, :],
+                s[:, 1 : (padding_size_actives + 1), :],
+                s[:, (padding_size_actives + 1) :, :],
+            )
+
+        query_embedding = self.layernorm_query(query_embedding)
+        support_actives_embedding = self.layernorm_support_actives(
+            support_actives_embedding
+        )
+        if support_inactives_embedding is not None:
+            support_inactives_embedding = self.layernorm_support_inactives(
+                support_inactives_embedding
+            )
         return query_embedding, support_actives_embedding, support_inactives_embedding
 
 
@@ -285,6 +432,7 @@ class CrossAttentionModule(nn.Module):
         super(CrossAttentionModule, self).__init__()
 
         self.cfg = cfg
+        self.activity_embedding_dim = cfg.model.transformer.activity_embedding_dim
 
         transformer_encoder_layer = torch.nn.TransformerEncoderLayer(
             d_model=(
@@ -294,12 +442,58 @@ class CrossAttentionModule(nn.Module):
             nhead=self.cfg.model.transformer.number_heads,
             dim_feedforward=self.cfg.model.transformer.dim_forward,
             dropout=self.cfg.model.transformer.dropout,
+            batch_first=True,
         )
+        # Nested tensors would zero the outputs at masked positions, which changes the
+        # representations the pretrained weights were trained with
         self.transformer = torch.nn.TransformerEncoder(
             transformer_encoder_layer,
             num_layers=self.cfg.model.transformer.num_layers,
+            enable_nested_tensor=False,
         )
 
+        # Padding mask column of the query molecules (never masked). It is grown on
+        # demand to the largest batch size seen and sliced in forward.
+        self.register_buffer(
+            "_query_pad", torch.zeros(1, 1, dtype=torch.bool), persistent=False
+        )
+
+        # Activity encoding of the stacked query and support set molecules. It only
+        # depends on the padding sizes and is rebuilt whenever these change.
+        self.register_buffer(
+            "_activity_encoding",
+            torch.empty(1, 0, self.activity_embedding_dim),
+            persistent=False,
+        )
+        self._activity_encoding_padding = None
+
+    def _get_activity_encoding(
+        self, padding_size_actives: int, padding_size_inactives: int
+    ) -> torch.Tensor:
+        """
+        Returns the activity encoding for one query molecule followed by the active and
+        inactive support set molecules;
+        dim: [1, 1 + active-padding-dim + inactive-padding-dim, activity-embedding-dim]
+        """
+        if self._activity_encoding_padding != (
+            padding_size_actives,
+            padding_size_inactives,
+        ):
+            activity_encoding = self._activity_encoding.new_empty(
+                1,
+                1 + padding_size_actives + padding_size_inactives,
+                self.activity_embedding_dim,
+            )
+            activity_encoding[:, :1].zero_()
+            activity_encoding[:, 1 : (padding_size_actives + 1)].fill_(1.0)
+            activity_encoding[:, (padding_size_actives + 1) :].fill_(-1.0)
+            self._activity_encoding = activity_encoding
+            self._activity_encoding_padding = (
+                padding_size_actives,
+                padding_size_inactives,
+            )
+        return self._activity_encoding
+
     def forward(
         self,
         query_embedding: torch.Tensor,
@@ -336,94 +530,64 @@ class CrossAttentionModule(nn.Module):
         # Embedding dim of query and support set molecules
         embedding_dim = support_actives_embedding.shape[2]
 
-        # Add activity encoding to representations
+        # Add activity encoding to representations and concatenate query and support set
+        # molecules. All parts are written into one preallocated tensor, which avoids
+        # intermediate copies of the embeddings.
         # Activity encoding:
         # - active: 1
         # - inactive: -1
         # - unknown (query): 0
-        query_embedding = torch.cat(
-            [
-                query_embedding,
-                torch.zeros_like(
-                    query_embedding[
-                        :, :, : self.cfg.model.transformer.activity_embedding_dim
-                    ]
-                ),
-            ],
-            dim=2,
-        )
-
-        support_actives_embedding = torch.cat(
-            [
-                support_actives_embedding,
-                torch.ones_like(
-                    support_actives_embedding[
-                        :, :, : self.cfg.model.transformer.activity_embedding_dim
-                    ]
-                ),
-            ],
-            dim=2,
-        )
-
-        support_inactives_embedding = torch.cat(
-            [
-                support_inactives_embedding,
-                (-1.0)
-                * torch.ones_like(
-                    support_inactives_embedding[
-                        :, :, : self.cfg.model.transformer.activity_embedding_dim
-                    ]
-                ),
-            ],
-            dim=2,
-        )
-
-        # Concatenate query and support set molecules
-        s = torch.cat(
-            [query_embedding, support_actives_embedding, support_inactives_embedding],
-            dim=1,
+        padding_size_actives = support_actives_embedding.shape[1]
+        padding_size_inactives = support_inactives_embedding.shape[1]
+        s = query_embedding.new_empty(
+            query_embedding.shape[0],
+            1 + padding_size_actives + padding_size_inactives,
+            embedding_dim + self.activity_embedding_dim,
         )
+        s[:, :1, :embedding_dim] = query_embedding
+        s[:, 1 : (padding_size_actives + 1), :embedding_dim] = support_actives_embedding
+        s[:, (padding_size_actives + 1) :, :embedding_dim] = support_inactives_embedding
+        s[:, :, embedding_dim:] = self._get_activity_encoding(
+            padding_size_actives, padding_size_inactives
+        )  # broadcast over the batch
 
         # Create padding mask
+        batch_size = support_actives_mask.shape[0]
+        if self._query_pad.shape[0] < batch_size:
+            self._query_pad = support_actives_mask.new_zeros(
+                batch_size, 1, dtype=torch.bool
+            )
         padding_mask = torch.cat(
             [
-                torch.tensor([False] * support_actives_mask.shape[0])
-                .reshape(-1, 1)
-                .to(self.cfg.system.ressources.device),  # query molecules
-                # .to("cpu"),  # query molecules
-                support_actives_mask,  # active support set molecules
-                support_inactives_mask,  # inactive support set molecules
+                self._query_pad[:batch_size],  # query molecules
+                support_actives_mask.bool(),  # active support set molecules
+                support_inactives_mask.bool(),  # inactive support set molecules
             ],
             dim=1,
-        ).bool()
+        )
 
         # Run transformer and update representations
-        s = torch.transpose(s, 0, 1)
-        s_h = self.transformer(s, src_key_padding_mask=padding_mask)
-        s = torch.transpose(s, 0, 1)
-        s_h = torch.transpose(s_h, 0, 1)
-        s_updated = s + s_h
+        with fused_attention():
+            s_h = self.transformer(s, src_key_padding_mask=padding_mask)
+        # Outer skip connection on top of the residuals inside the encoder layers. The
+        # pretrained weights depend on it, so it is kept, but added in place: the
+        # transformer output ends with a layernorm whose backward does not need it.
+        s_updated = s_h.add_(s)
 
         # Split representations into query, active, and inactive support set molecules
         query_embedding = s_updated[:, 0, :embedding_dim]
         query_embedding = torch.unsqueeze(query_embedding, 1)
         support_actives_embedding = s_updated[
-            :, 1 : (support_actives_embedding.shape[1] + 1), :embedding_dim
+            :, 1 : (padding_size_actives + 1), :embedding_dim
         ]
         support_inactives_embedding = s_updated[
-            :, (support_actives_embedding.shape[1] + 1) :, :embedding_dim
+            :, (padding_size_actives + 1) :, :embedding_dim
         ]
 
         return query_embedding, support_actives_embedding, support_inactives_embedding
 
 
-def SimilarityModule(
-    query_embedding: torch.Tensor,
-    support_set_embeddings: torch.Tensor,
-    padding_mask: torch.Tensor,
-    support_set_size: torch.Tensor,
-    cfg: OmegaConf,
-) -> torch.Tensor:
+class SimilarityModule(nn.Module):
     """
     The similarity module builds the activity prediction for the query molecule from a
     weighted sum over the support set labels. Pair-wise similarity values between query
@@ -433,67 +597,82 @@ def SimilarityModule(
     active and once for the inactive support set molecules, the support_set_embeddings
     here mean ether active or inactive support set molecule embeddings.
 
-    inputs:
-    - query; torch.tensor;
-      dim: [batch-size, 1, embedding-dimension]
-        * e.g.: [512, 1, 1024]
-    - support set molecules; torch.tensor;
-      dim: [batch-size, padding-dim, embedding-dimension]
-        * e.g.: [512, 9, 1024]
-    - padding mask; torch.tensor; boolean
-      dim: [batch-size, padding-dim]
-        * e.g.: [512, 9]
-    - support set size; torch.tensor;
-      dim: [batch-size]
-        * e.g.: [512]
+    The config options are resolved once at construction, the forward pass only
+    branches on plain Python values, which keeps the module compatible with
+    torch.jit.script.
     """
 
-    # Optional L2-norm
-    if cfg.model.similarityModule.l2Norm:
-        query_embedding_div = torch.unsqueeze(
-            query_embedding.pow(2).sum(dim=2).sqrt(), 2
-        )
-        query_embedding_div[query_embedding_div == 0] = 1
-        support_set_embeddings_div = torch.unsqueeze(
-            support_set_embeddings.pow(2).sum(dim=2).sqrt(), 2
-        )
-        support_set_embeddings_div[support_set_embeddings_div == 0] = 1
-
-        query_embedding = query_embedding / query_embedding_div
-        support_set_embeddings = support_set_embeddings / support_set_embeddings_div
+    def __init__(self, cfg: OmegaConf):
+        super(SimilarityModule, self).__init__()
 
-    # Compute similarity values
-    similarities = query_embedding @ torch.transpose(support_set_embeddings, 1, 2)
-    # dim:
-    # [batch-size, 1, padding-dim] =
-    # [batch-size, 1, emb-dim] x [batch-size, emb-dim, padding-dim]
+        self.l2_norm = bool(cfg.model.similarityModule.l2Norm)
+        # Unknown scaling options fall back to no scaling
+        self.scaling_mode = similarity_scaling_mapping.get(
+            cfg.model.similarityModule.scaling, 0
+        )
+        self.stabilizer = 1e-8
 
-    # Padding mask
-    mask = (
-        (padding_mask.bool()).float().unsqueeze(1)
-    )
+    def forward(
+        self,
+        query_embedding: torch.Tensor,
+        support_set_embeddings: torch.Tensor,
+        padding_mask: torch.Tensor,
+        support_set_size: torch.Tensor,
+    ) -> torch.Tensor:
+        """
+        inputs:
+        - query; torch.tensor;
+          dim: [batch-size, 1, embedding-dimension]
+            * e.g.: [512, 1, 1024]
+        - support set molecules; torch.tensor;
+          dim: [batch-size, padding-dim, embedding-dimension]
+            * e.g.: [512, 9, 1024]
+        - padding mask; torch.tensor; boolean
+          dim: [batch-size, padding-dim]
+            * e.g.: [512, 9]
+        - support set size; torch.tensor;
+          dim: [batch-size]
+            * e.g.: [512]
+        """
 
-    # Compute similarity values while ignoring padding artefacts
-    similarities = similarities * mask
-    similarity_sums = similarities.sum(
-        dim=2
-    )  # For every query molecule: Sum over support set molecules
-
-    # Scaling
-    if cfg.model.similarityModule.scaling == "1/N":
-        stabilizer = torch.tensor(1e-8).float()
-        similarity_sums = (
-            1 / (2.0 * support_set_size.reshape(-1, 1) + stabilizer) * similarity_sums
-        )
-    if cfg.model.similarityModule.scaling == "1/sqrt(N)":
-        stabilizer = torch.tensor(1e-8).float()
-        similarity_sums = (
-            1
-            / (2.0 * torch.sqrt(support_set_size.reshape(-1, 1).float()) + stabilizer)
-            * similarity_sums
-        )
+        # Optional L2-norm (zero vectors, e.g. padding, stay zero). The query norm is
+        # applied to the similarity sums below, <q / |q|, s> = <q, s> / |q|, which avoids
+        # a normalized copy of the query.
+        if self.l2_norm:
+            support_set_embeddings = normalize(support_set_embeddings, p=2.0, dim=2)
+
+        # Padding mask (boolean, True for support set molecules), cast once to the
+        # embedding dtype
+        mask = padding_mask.to(dtype=support_set_embeddings.dtype)
+
+        # Sum of the similarity values over the support set molecules while ignoring
+        # padding artefacts. Since the similarity is a dot product, the sum over support
+        # set molecules can be taken before the product with the query:
+        # sum_n <q, s_n> = <q, sum_n s_n>
+        # The masked sum is a single contraction, no masked copy of the support set is
+        # materialized.
+        support_set_embeddings_sum = torch.einsum(
+            "bn,bnd->bd", [mask, support_set_embeddings]
+        ).unsqueeze(1)
+        # dim: [batch-size, 1, emb-dim]
+        similarity_sums = (query_embedding * support_set_embeddings_sum).sum(dim=2)
+        # dim: [batch-size, 1]
+        if self.l2_norm:
+            # Same clamping as in normalize
+            similarity_sums = similarity_sums / torch.linalg.vector_norm(
+                query_embedding, dim=2
+            ).clamp_min(1e-12)
+
+        # Scaling
+        if self.scaling_mode != 0:
+            support_set_size = support_set_size.view(-1, 1).to(similarity_sums.dtype)
+            if self.scaling_mode == 2:
+                support_set_size = torch.sqrt(support_set_size)
+            similarity_sums = similarity_sums / (
+                2.0 * support_set_size + self.stabilizer
+            )
 
-    return similarity_sums
+        return similarity_sums
 
 
 if __name__ == "__main__":
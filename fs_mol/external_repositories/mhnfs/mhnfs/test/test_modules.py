@@ -0,0 +1,112 @@
+import sys
+
+import pytest
+import torch
+import torch.nn as nn
+from omegaconf import OmegaConf
+from pyprojroot import here as project_root
+
+sys.path.insert(0, str(project_root()))
+
+from fs_mol.external_repositories.mhnfs.mhnfs.modules import ContextModule, EncoderBlock
+
+
+@pytest.fixture
+def cfg():
+
+    return OmegaConf.create(
+        {
+            "model": {
+                "associationSpace_dim": 16,
+                "hopfield": {"dim_QK": 8, "heads": 2, "beta": 0.25, "dropout": 0.0},
+                "context": {},
+                "encoder": {
+                    "activation": "selu",
+                    "input_dim": 32,
+                    "number_hidden_neurons": 24,
+                    "number_hidden_layers": 2,
+                    "regularization": {"input_dropout": 0.0, "dropout": 0.0},
+                },
+            }
+        }
+    )
+
+
+@pytest.fixture
+def inputs():
+
+    torch.manual_seed(0)
+    query = torch.randn(4, 1, 16)
+    actives = torch.randn(4, 3, 16)
+    inactives = torch.randn(4, 5, 16)
+    context = torch.randn(1, 10, 16)
+
+    return query, actives, inactives, context
+
+
+def assert_outputs_close(outputs, expected_outputs):
+    for output, expected_output in zip(outputs, expected_outputs):
+        assert torch.allclose(output, expected_output, atol=1e-6)
+
+
+def test_precompute_context(cfg, inputs):
+    query, actives, inactives, context = inputs
+    module = ContextModule(cfg).eval()
+
+    with torch.no_grad():
+        expected_outputs = module(query, actives, inactives, context)
+        module.precompute_context(context)
+        outputs = module(query, actives, inactives, context)
+
+    assert_outputs_close(outputs, expected_outputs)
+
+
+def test_precompute_context_other_context(cfg, inputs):
+    query, actives, inactives, context = inputs
+    module = ContextModule(cfg).eval()
+
+    with torch.no_grad():
+        expected_outputs = module(query, actives, inactives, context)
+        module.precompute_context(context)
+
+        # Invalidate the cache, only the cached context set tensor may use it
+        module._context_values.zero_()
+        cached_outputs = module(query, actives, inactives, context)
+        outputs = module(query, actives, inactives, context.clone())
+
+    assert not torch.allclose(cached_outputs[0], expected_outputs[0])
+    assert_outputs_close(outputs, expected_outputs)
+
+
+class EncoderParent(nn.Module):
+    def __init__(self, cfg):
+        super(EncoderParent, self).__init__()
+        self.encoder = EncoderBlock(cfg)
+
+    def forward(self, molecules):
+        return self.encoder(molecules)
+
+
+@pytest.mark.parametrize("jit", [False, True])
+def test_encoder_legacy_state_dict(cfg, jit):
+    torch.manual_seed(0)
+    reference = EncoderParent(cfg).eval()
+
+    # Keys of the original MHNfs implementation
+    net = reference.encoder.net
+    legacy_layers = {"fc": net.input, "fc_o": net.output}
+    for i, layer in enumerate(net.hidden):
+        legacy_layers[f"hidden_linear_layers.{i}"] = layer
+    legacy_state_dict = {
+        f"encoder.{name}.{parameter}": value.clone()
+        for name, layer in legacy_layers.items()
+        for parameter, value in layer.linear.state_dict().items()
+    }
+
+    cfg.model.encoder.jit = jit
+    model = EncoderParent(cfg).eval()
+    model.load_state_dict(legacy_state_dict, strict=True)
+
+    molecules = torch.randn(4, 32)
+    with torch.no_grad():
+        assert torch.allclose(model(molecules), reference(molecules))
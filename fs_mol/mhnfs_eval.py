@@ -151,6 +151,8 @@ def launch_evaluation(
         "backbone_pretrained_models/model_weights/mhnfs/epoch=94-step=19855.ckpt"
     )
     model.load_state_dict(checkpoint)
+    model.encoder._fuse_for_inference()
+    model.contextModule.precompute_context(model.context_embedding)
 
     # model = model.load_from_checkpoint(path_checkpoint)
 